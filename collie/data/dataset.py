@@ -5,6 +5,7 @@ import json
 import mmap
 import os
 import random
+import re
 import threading
 from functools import reduce
 from typing import Dict, List, Optional, Sequence, Tuple
@@ -17,6 +18,11 @@ from transformers import PreTrainedTokenizer
 
 from collie.driver.io import FileIODriver
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 __all__ = [
     "CollieDatasetForTraining",
     "CollieDatasetForGeneration",
@@ -24,6 +30,25 @@ __all__ = [
 ]
 
 
+_LONG_DIGITS = re.compile(rb"\d{19,}")
+
+
+def _loads_line(line: bytes):
+    """解析分片文件中的一行数据，安装了 ``orjson`` 时优先使用。
+
+    写入时仍使用 ``json.dumps``（默认 ``ensure_ascii=True``），保证分片文件是纯 ASCII，
+    与 ``.meta`` 中记录的字节偏移在任何 locale 下都一致。
+    """
+    # orjson 会把超过 64 位的整数静默转换为浮点数，遇到长数字时交给 json 解析
+    if orjson is not None and _LONG_DIGITS.search(line) is None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # json.dumps 默认会写出 NaN/Infinity，orjson 不接受
+            pass
+    return json.loads(line.decode())
+
+
 class _ShardContainer(list):
     def __init__(self, path, shuffle: bool = False, seed: int = 1024) -> None:
         list.__init__([])
@@ -81,7 +106,7 @@ class _ShardContainer(list):
                 self.file.close()
             self.file = self._get_mmap(self.file_name)
         self.file.seek(meta["offset"])
-        return json.loads(self.file.readline().decode())
+        return _loads_line(self.file.readline())
 
 
 def _inspect_special_tokens_length(tokenizer):
@@ -169,11 +194,16 @@ class CollieDatasetForTraining(Dataset):
         index = self.indices[index]
         if self.tokenizer is None:
             input_ids = self.dataset[index]["tokens"]
-            labels = self.dataset[index].get("labels", input_ids.detach().clone())
+            if "labels" in self.dataset[index].keys():
+                labels = self.dataset[index]["labels"]
+            elif isinstance(input_ids, torch.Tensor):
+                labels = input_ids.detach().clone()
+            else:
+                labels = list(input_ids)
             if "attention_mask" in self.dataset[index].keys():
                 attention_mask = self.dataset[index]["attention_mask"]
             else:
-                attention_mask = torch.ones_like(torch.tensor(input_ids)).cpu().tolist()
+                attention_mask = [1] * len(input_ids)
         else:
             if "text" in self.dataset[0].keys():
                 inputs = self.tokenizer(
@@ -181,34 +211,34 @@ class CollieDatasetForTraining(Dataset):
                     add_special_tokens=self.add_special_tokens,
                 )
                 input_ids = inputs["input_ids"]
-                labels = torch.tensor(input_ids).cpu().tolist()
-                attention_mask = inputs.get(
-                    "attention_mask",
-                    torch.ones_like(torch.tensor(input_ids)).cpu().tolist(),
-                )
+                labels = list(input_ids)
+                # 部分 tokenizer（如 chatglm）会构造自己的 attention_mask，需保留
+                if "attention_mask" in inputs.keys():
+                    attention_mask = inputs["attention_mask"]
+                else:
+                    attention_mask = [1] * len(input_ids)
             elif (
                 "input" in self.dataset[0].keys() and "output" in self.dataset[0].keys()
             ):
+                # 完整文本与 output 部分一次性批量分词
                 inputs = self.tokenizer(
-                    self.dataset[index]["input"] + self.dataset[index]["output"],
-                    add_special_tokens=self.add_special_tokens,
-                )
-                input_ids = inputs["input_ids"]
-                attention_mask = inputs.get(
-                    "attention_mask",
-                    torch.ones_like(torch.tensor(input_ids)).cpu().tolist(),
-                )
-                labels = torch.tensor(input_ids)
-                target_length = len(
-                    self.tokenizer(
+                    [
+                        self.dataset[index]["input"] + self.dataset[index]["output"],
                         self.dataset[index]["output"],
-                        add_special_tokens=self.add_special_tokens,
-                    ).input_ids
+                    ],
+                    add_special_tokens=self.add_special_tokens,
                 )
+                input_ids = inputs["input_ids"][0]
+                if "attention_mask" in inputs.keys():
+                    attention_mask = inputs["attention_mask"][0]
+                else:
+                    attention_mask = [1] * len(input_ids)
+                labels = np.array(input_ids)
+                target_length = len(inputs["input_ids"][1])
                 if self.add_special_tokens:
                     target_length -= self.bos_length
                 labels[: -target_length] = -100
-                labels = labels.cpu().tolist()
+                labels = labels.tolist()
             else:
                 raise ValueError("Dataset must have one or two fields.")
         if self.max_length > 0:
@@ -302,25 +332,31 @@ class CollieDatasetForGeneration(CollieDatasetForTraining):
             if "attention_mask" in self.dataset[index].keys():
                 attention_mask = self.dataset[index]["attention_mask"]
             else:
-                attention_mask = torch.ones_like(torch.tensor(input_ids).cpu().tolist())
+                attention_mask = [1] * len(input_ids)
             target = self.dataset[index].get("target", None)
         else:
             inputs = self.tokenizer(
-                self.dataset[index]["text"], add_special_tokens=self.add_special_tokens
+                self.dataset[index]["text"],
+                add_special_tokens=self.add_special_tokens,
             )
             input_ids = inputs["input_ids"]
-            attention_mask = inputs.get(
-                "attention_mask",
-                torch.ones_like(torch.tensor(input_ids)).cpu().tolist(),
-            )
+            if "attention_mask" in inputs.keys():
+                attention_mask = inputs["attention_mask"]
+            else:
+                attention_mask = [1] * len(input_ids)
             if "target" in self.dataset[index].keys():
                 if isinstance(self.dataset[index]["target"], str):
-                    target = [self.tokenizer(self.dataset[index]["target"]).input_ids]
-                elif isinstance(self.dataset[index]["target"], (list, tuple, set)):
                     target = [
-                        self.tokenizer(x).input_ids
-                        for x in self.dataset[index]["target"]
+                        self.tokenizer(
+                            self.dataset[index]["target"], return_attention_mask=False
+                        ).input_ids
                     ]
+                elif isinstance(self.dataset[index]["target"], (list, tuple, set)):
+                    targets = list(self.dataset[index]["target"])
+                    # tokenizer 无法处理空的 batch
+                    target = [] if not targets else self.tokenizer(
+                        targets, return_attention_mask=False
+                    ).input_ids
         if self.max_length > 0:
             input_ids = input_ids[: self.max_length]
             attention_mask = attention_mask[: self.max_length]
@@ -391,29 +427,39 @@ class CollieDatasetForClassification(CollieDatasetForTraining):
                     input_ids = []
                     attention_mask = []
                     labels = []
-                    for output in self.dataset[index]["output"]:
+                    outputs = list(self.dataset[index]["output"])
+                    # 重复的候选项只需单独分词一次
+                    unique_outputs = list(dict.fromkeys(outputs))
+                    # 所有候选项的完整文本与候选项本身一次性批量分词，
+                    # tokenizer 无法处理空的 batch
+                    if outputs:
                         inputs = self.tokenizer(
-                            self.dataset[index]["input"] + output,
+                            [self.dataset[index]["input"] + output for output in outputs]
+                            + unique_outputs,
                             add_special_tokens=self.add_special_tokens,
                         )
-                        input_ids.append(inputs.get("input_ids"))
-                        attention_mask.append(
-                            inputs.get(
-                                "attention_mask",
-                                torch.ones_like(torch.tensor(inputs.get("input_ids"))),
-                            )
-                        )
-                        label = torch.tensor(inputs.get("input_ids"))
-                        target_length = len(
-                            self.tokenizer(
-                                output,
-                                add_special_tokens=self.add_special_tokens,
-                            ).input_ids
+                    else:
+                        inputs = {"input_ids": []}
+                    num_outputs = len(outputs)
+                    output_lengths = {
+                        output: len(output_ids)
+                        for output, output_ids in zip(
+                            unique_outputs, inputs["input_ids"][num_outputs:]
                         )
+                    }
+                    for i in range(num_outputs):
+                        sample_ids = inputs["input_ids"][i]
+                        input_ids.append(sample_ids)
+                        if "attention_mask" in inputs.keys():
+                            attention_mask.append(inputs["attention_mask"][i])
+                        else:
+                            attention_mask.append([1] * len(sample_ids))
+                        label = np.array(sample_ids)
+                        target_length = output_lengths[outputs[i]]
                         if self.add_special_tokens:
                             target_length -= self.bos_length
                         label[: -target_length] = -100
-                        label = label.cpu().tolist()
+                        label = label.tolist()
                         labels.append(label)
 
                     input_ids = tuple(input_ids)
@@ -447,10 +493,10 @@ class CollieDatasetForClassification(CollieDatasetForTraining):
                         add_special_tokens=self.add_special_tokens,
                     )
                     input_ids = inputs["input_ids"]
-                    attention_mask = inputs.get(
-                        "attention_mask",
-                        torch.ones_like(torch.tensor(input_ids)).cpu().tolist(),
-                    )
+                    if "attention_mask" in inputs.keys():
+                        attention_mask = inputs["attention_mask"]
+                    else:
+                        attention_mask = [1] * len(input_ids)
                     output = tuple([option for option in self.dataset[index]["output"]])
                     target = self.dataset[index]["target"]
                 else:
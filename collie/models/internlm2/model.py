@@ -1141,15 +1141,15 @@ class InternLM2ForCausalLM(CollieModelForCausalLM):
         return reordered_past
 
     def build_inputs(self, tokenizer, query: str, history: List[Tuple[str, str]] = [], meta_instruction=""):
-        if tokenizer.add_bos_token:
-            prompt = ""
-        else:
-            prompt = tokenizer.bos_token
+        segments = []
+        if not tokenizer.add_bos_token:
+            segments.append(tokenizer.bos_token)
         if meta_instruction:
-            prompt += f"""<|im_start|>system\n{meta_instruction}<|im_end|>\n"""
+            segments.append(f"""<|im_start|>system\n{meta_instruction}<|im_end|>\n""")
         for record in history:
-            prompt += f"""<|im_start|>user\n{record[0]}<|im_end|>\n<|im_start|>assistant\n{record[1]}<|im_end|>\n"""
-        prompt += f"""<|im_start|>user\n{query}<|im_end|>\n<|im_start|>assistant\n"""
+            segments.append(f"""<|im_start|>user\n{record[0]}<|im_end|>\n<|im_start|>assistant\n{record[1]}<|im_end|>\n""")
+        segments.append(f"""<|im_start|>user\n{query}<|im_end|>\n<|im_start|>assistant\n""")
+        prompt = "".join(segments)
         return tokenizer([prompt], return_tensors="pt")
 
     @torch.no_grad()
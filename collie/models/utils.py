@@ -1,5 +1,6 @@
 import json
 import os
+from functools import lru_cache
 
 import torch
 from einops import rearrange
@@ -57,6 +58,14 @@ def flash_attention(query, key, value, attention_mask):
     return output
 
 
+@lru_cache(maxsize=None)
+def _kv_cache_keys(idx):
+    """
+    第idx层的kv_cache在inputs字典中对应的字段名，每层只构造一次
+    """
+    return f"past_key_values_layer{idx}_key", f"past_key_values_layer{idx}_value"
+
+
 def kv_cache_to_inputs_for_model(past_key_values):
     """
     在模型的输入阶段，将嵌套元组形式的past_key_values转化为inputs字典中的每个字段
@@ -64,8 +73,9 @@ def kv_cache_to_inputs_for_model(past_key_values):
     inputs = {}
     if past_key_values is not None:
         for i, past_key_value in enumerate(past_key_values):
-            inputs[f"past_key_values_layer{i}_key"] = past_key_value[0]
-            inputs[f"past_key_values_layer{i}_value"] = past_key_value[1]
+            key_name, value_name = _kv_cache_keys(i)
+            inputs[key_name] = past_key_value[0]
+            inputs[value_name] = past_key_value[1]
     return inputs
 
 
@@ -73,14 +83,14 @@ def inputs_to_kv_cache_for_model(num_hidden_layers, inputs):
     """
     在模型的输出阶段，将inputs字典中的kv_cache转化为嵌套元组形式的past_key_values
     """
-    past_key_values = ()
+    past_key_values = []
     for i in range(0, num_hidden_layers):
+        key_name, value_name = _kv_cache_keys(i)
         try:
-            past_key_values += ((inputs[f"past_key_values_layer{i}_key"],
-                            inputs[f"past_key_values_layer{i}_value"]), )
+            past_key_values.append((inputs[key_name], inputs[value_name]))
         except:
             break
-    return past_key_values if past_key_values != () else None
+    return tuple(past_key_values) if past_key_values else None
 
 
 def kv_cache_to_inputs_for_layer(idx, new_layer_past):
@@ -89,8 +99,9 @@ def kv_cache_to_inputs_for_layer(idx, new_layer_past):
     """
     inputs = {}
     if new_layer_past is not None:
-        inputs[f"past_key_values_layer{idx}_key"] = new_layer_past[0]
-        inputs[f"past_key_values_layer{idx}_value"] = new_layer_past[1]
+        key_name, value_name = _kv_cache_keys(idx)
+        inputs[key_name] = new_layer_past[0]
+        inputs[value_name] = new_layer_past[1]
     return inputs
 
 
@@ -98,9 +109,9 @@ def inputs_to_kv_cache_for_layer(idx, inputs):
     """
     在第idx层的输入阶段，将inputs字典中的kv_cahce转化为元组形式的layer_past
     """
-    if f"past_key_values_layer{idx}_key" in inputs and f"past_key_values_layer{idx}_value" in inputs:
-        return (inputs[f"past_key_values_layer{idx}_key"], 
-                inputs[f"past_key_values_layer{idx}_value"]) 
+    key_name, value_name = _kv_cache_keys(idx)
+    if key_name in inputs and value_name in inputs:
+        return (inputs[key_name], inputs[value_name])
     else:
         return None
 
@@ -71,7 +71,8 @@ class LinearWithHiddenStates(nn.Linear):
         
     def forward(self, input_):
         if not self.training:
-            self.hidden_states = input_
+            # 只保存数值，不持有 autograd 图
+            self.hidden_states = input_.detach()
         else:
             self.hidden_states = None
         return super().forward(input_)
@@ -88,7 +89,8 @@ class ColumnParallelLMHead(ColumnParallelLinearWithoutBias):
 
     def forward(self, input_):
         if not self.training:
-            self.hidden_states = input_
+            # 只保存数值，不持有 autograd 图
+            self.hidden_states = input_.detach()
         else:
             self.hidden_states = None
         return super().forward(input_)
@@ -140,10 +142,10 @@ class GPTLMLoss(torch.nn.Module):
         :param logits: 语言模型的输出
         :param labels: 真实标签
         """
-        shift_logits = logits[..., :-1, :].float().contiguous()
-        shift_labels = labels[..., 1:].contiguous().to(logits.device)
-        # Flatten the tokens
-        return self.loss(shift_logits.view(-1, shift_logits.size(-1)), shift_labels.view(-1))
+        shift_logits = logits[..., :-1, :].float()
+        shift_labels = labels[..., 1:].to(logits.device, non_blocking=True)
+        # Flatten the tokens, reshape only copies when the shifted view cannot be flattened
+        return self.loss(shift_logits.reshape(-1, shift_logits.size(-1)), shift_labels.reshape(-1))
 
 
 class PipelineGenerationMixin(GenerationMixin):
@@ -382,37 +384,42 @@ class PipelineGenerationMixin(GenerationMixin):
         """ 从流水线 `engine` 中找到所有的层
         """
         self.layers = self.forward_funcs
+        # attr_name -> 拥有该属性的层，层发生变化时需要重新调用本函数
+        self._layers_with_attr = {}
+
+    def _get_layers_with_attr(self, attr_name: str):
+        """ 获取拥有属性 `attr_name` 的所有层，结果会被缓存以避免每一步生成都遍历
+        所有层
+        """
+        layers = self._layers_with_attr.get(attr_name)
+        if layers is None:
+            layers = [layer for layer in self.layers if hasattr(layer, attr_name)]
+            self._layers_with_attr[attr_name] = layers
+        return layers
             
     def _get_hidden_states(self, attr_name: str="hidden_states"):
         """ 从所有层中获取 `hidden_states`
         """
-        all_hidden_states = []
-        for layer in self.layers:
-            if hasattr(layer, attr_name):
-                all_hidden_states.append(getattr(layer, attr_name))
+        all_hidden_states = [getattr(layer, attr_name) for layer in self._get_layers_with_attr(attr_name)]
         return tuple(all_hidden_states) if None not in all_hidden_states else None
     
     def _clean_hidden_states(self, attr_name: str="hidden_states"):
         """ 清除所有层中的 `hidden_states`
         """
-        for layer in self.layers:
-            if hasattr(layer, attr_name):
-                object.__setattr__(layer, attr_name, None)
+        for layer in self._get_layers_with_attr(attr_name):
+            layer.__dict__[attr_name] = None
                 
     def _set_hidden_states(self, hidden_states: List[torch.Tensor], attr_name: str="hidden_states"):
         """ 设置所有层中的 `hidden_states`
         """
-        hidden_states = iter(hidden_states)
-        for layer in self.layers:
-            if hasattr(layer, attr_name):
-                object.__setattr__(layer, attr_name, next(hidden_states))   
+        for layer, layer_hidden_states in zip(self._get_layers_with_attr(attr_name), hidden_states):
+            layer.__dict__[attr_name] = layer_hidden_states
                 
     def _set_use_cache(self, use_cache: bool=True, attr_name: str="use_cache"):
         """ 设置所有层中的 `use_cache`
         """ 
-        for layer in self.layers:
-            if hasattr(layer, attr_name):
-                object.__setattr__(layer, attr_name, use_cache)
+        for layer in self._get_layers_with_attr(attr_name):
+            layer.__dict__[attr_name] = use_cache
 
 class PipelineModel(PipelineModule, PipelineGenerationMixin):
     """
@@ -646,6 +653,7 @@ class PipelineModel(PipelineModule, PipelineGenerationMixin):
             elif self.get_input_embedding()[1] in list(self._modules.values()):
                 self.add_module(str(name), embedding)
         self.forward_funcs[name] = embedding
+        self._find_layers()
 
     def set_lm_head(self, name, lm_head):
         if self.get_lm_head()[1] is not None:
@@ -655,6 +663,7 @@ class PipelineModel(PipelineModule, PipelineGenerationMixin):
             elif self.get_lm_head()[1] in list(self._modules.values()):
                 self.add_module(str(name), lm_head)
         self.forward_funcs[name] = lm_head
+        self._find_layers()
         
     def tie_weights(self):
         pass
@@ -5,11 +5,14 @@ sys.path.append("..")
 from collie import Server, LlamaForCausalLM, DashProvider, CollieConfig
 from transformers import LlamaTokenizer, GenerationConfig
 
-config = CollieConfig.from_pretrained("decapoda-research/llama-7b-hf", trust_remote_code=True)
+model_path = "openlm-research/open_llama_13b"
+config = CollieConfig.from_pretrained(model_path, trust_remote_code=True)
 config.pp_size = 1
 config.tp_size = 1
-model = LlamaForCausalLM.from_pretrained("openlm-research/open_llama_13b", config=config).cuda()
-tokenizer = LlamaTokenizer.from_pretrained("openlm-research/open_llama_13b", add_eos_token=False)
+# 直接以半精度构建并加载权重，避免在内存中先生成 fp32 的模型
+config.model_config.torch_dtype = torch.float16
+model = LlamaForCausalLM.from_pretrained(model_path, config=config).cuda()
+tokenizer = LlamaTokenizer.from_pretrained(model_path, add_eos_token=False)
 data_provider = DashProvider(tokenizer=tokenizer)
 data_provider.generation_config = GenerationConfig(max_new_tokens=250)
 server = Server(model, data_provider)
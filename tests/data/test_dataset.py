@@ -0,0 +1,261 @@
+import sys
+sys.path.append("../..")
+import math
+
+import pytest
+import torch
+
+import collie.data.dataset as collie_dataset
+from collie.data.dataset import (CollieDatasetForTraining, CollieDatasetForGeneration,
+                                 CollieDatasetForClassification)
+
+
+class TestPretokenizedDataset:
+
+    def test_training_tokens_only(self):
+        """
+            测试只提供 list 形式的 tokens 时自动生成 labels 和 attention_mask
+        """
+        dataset = CollieDatasetForTraining([{"tokens": [1, 2, 3]}])
+        sample = dataset[0]
+        assert sample["input_ids"] == [1, 2, 3]
+        assert sample["labels"] == [1, 2, 3]
+        assert sample["attention_mask"] == [1, 1, 1]
+
+    def test_training_with_labels_and_attention_mask(self):
+        """
+            测试提供 labels 和 attention_mask 时直接使用
+        """
+        dataset = CollieDatasetForTraining([{
+            "tokens": [1, 2, 3],
+            "labels": [-100, 2, 3],
+            "attention_mask": [1, 1, 0],
+        }])
+        sample = dataset[0]
+        assert sample["input_ids"] == [1, 2, 3]
+        assert sample["labels"] == [-100, 2, 3]
+        assert sample["attention_mask"] == [1, 1, 0]
+
+    def test_training_tensor_tokens(self):
+        """
+            测试 tokens 为 tensor 时 labels 为其拷贝
+        """
+        tokens = torch.tensor([1, 2, 3])
+        dataset = CollieDatasetForTraining([{"tokens": tokens}])
+        sample = dataset[0]
+        assert torch.equal(sample["labels"], tokens)
+        assert sample["labels"] is not tokens
+        assert sample["attention_mask"] == [1, 1, 1]
+
+    def test_generation_tokens_only(self):
+        """
+            测试生成数据集只提供 list 形式的 tokens
+        """
+        dataset = CollieDatasetForGeneration([{"tokens": [4, 5]}])
+        sample = dataset[0]
+        assert sample["input_ids"] == [4, 5]
+        assert sample["labels"] == [4, 5]
+        assert sample["attention_mask"] == [1, 1]
+        assert "target" not in sample
+
+    def test_generation_with_attention_mask_and_target(self):
+        """
+            测试生成数据集提供 attention_mask 和 target
+        """
+        dataset = CollieDatasetForGeneration([{
+            "tokens": [4, 5],
+            "attention_mask": [0, 1],
+            "target": "目标文本",
+        }])
+        sample = dataset[0]
+        assert sample["attention_mask"] == [0, 1]
+        assert sample["target"] == "目标文本"
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_processed_round_trip(tmp_path, monkeypatch, use_orjson):
+    """
+        测试 save_propressed 与 from_processed 的往返，包含非 ASCII 的 target
+    """
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(collie_dataset, "orjson", None)
+    raw = [
+        {"tokens": [1, 2, 3], "target": "选项A"},
+        {"tokens": [4, 5], "attention_mask": [1, 0], "target": "答案：是"},
+        {"tokens": [6], "target": "plain"},
+        # json.dumps 会写出 NaN，超过 64 位的整数也需要原样读回
+        {"tokens": [7], "target": float("nan")},
+        {"tokens": [8], "target": 2 ** 70},
+        {"tokens": [9], "target": -(2 ** 63) - 1},
+    ]
+    CollieDatasetForGeneration(raw).save_propressed(str(tmp_path))
+    dataset = CollieDatasetForGeneration.from_processed(str(tmp_path))
+    assert len(dataset) == len(raw)
+    for i, item in enumerate(raw):
+        sample = dataset[i]
+        assert sample["input_ids"] == item["tokens"]
+        assert sample["attention_mask"] == item.get("attention_mask", [1] * len(item["tokens"]))
+        if isinstance(item["target"], float) and math.isnan(item["target"]):
+            assert math.isnan(sample["target"])
+        else:
+            assert sample["target"] == item["target"]
+            assert type(sample["target"]) is type(item["target"])
+
+
+class _StubEncoding(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class _StubTokenizer:
+    """
+        按字符分词的最小 tokenizer，``add_special_tokens`` 时在开头加上 bos (id 1)
+    """
+    bos_token_id = 1
+
+    def _encode(self, text, add_special_tokens):
+        ids = [ord(c) for c in text]
+        return [self.bos_token_id] + ids if add_special_tokens else ids
+
+    def __call__(self, text, add_special_tokens=True, return_attention_mask=None):
+        if isinstance(text, str):
+            input_ids = self._encode(text, add_special_tokens)
+            attention_mask = [1] * len(input_ids)
+        else:
+            if len(text) == 0:
+                # 与 PreTrainedTokenizerFast 一致，空 batch 会报错
+                raise IndexError("list index out of range")
+            input_ids = [self._encode(t, add_special_tokens) for t in text]
+            attention_mask = [[1] * len(ids) for ids in input_ids]
+        encoding = _StubEncoding(input_ids=input_ids)
+        if return_attention_mask is not False:
+            encoding["attention_mask"] = attention_mask
+        return encoding
+
+
+def _per_segment_labels(tokenizer, input, output, add_special_tokens, bos_length=1):
+    """
+        批量分词之前逐段分词、用 torch 构造 labels 的结果
+    """
+    input_ids = tokenizer(input + output, add_special_tokens=add_special_tokens).input_ids
+    labels = torch.tensor(input_ids)
+    target_length = len(tokenizer(output, add_special_tokens=add_special_tokens).input_ids)
+    if add_special_tokens:
+        target_length -= bos_length
+    labels[: -target_length] = -100
+    return input_ids, labels.cpu().tolist()
+
+
+class TestTokenizedDataset:
+
+    @pytest.mark.parametrize("add_special_tokens", [True, False])
+    @pytest.mark.parametrize("input, output", [("ab", "cd"), ("你好", "世界")])
+    def test_training_input_output(self, add_special_tokens, input, output):
+        """
+            测试 input/output 批量分词的结果与逐段分词一致
+        """
+        tokenizer = _StubTokenizer()
+        dataset = CollieDatasetForTraining(
+            [{"input": input, "output": output}],
+            tokenizer=tokenizer,
+            add_special_tokens=add_special_tokens,
+        )
+        input_ids, labels = _per_segment_labels(tokenizer, input, output, add_special_tokens)
+        sample = dataset[0]
+        assert sample["input_ids"] == input_ids
+        assert sample["labels"] == labels
+        assert sample["attention_mask"] == [1] * len(input_ids)
+
+    def test_training_text(self):
+        """
+            测试 text 字段计算所有 token 的 loss
+        """
+        dataset = CollieDatasetForTraining([{"text": "abc"}], tokenizer=_StubTokenizer())
+        sample = dataset[0]
+        assert sample["input_ids"] == [1, 97, 98, 99]
+        assert sample["labels"] == [1, 97, 98, 99]
+        assert sample["attention_mask"] == [1, 1, 1, 1]
+
+    @pytest.mark.parametrize("target", ["x", ["x", "yz"], ("x", "x"), []])
+    def test_generation_target(self, target):
+        """
+            测试 target 批量分词的结果与逐条分词一致，包括空的 target 列表
+        """
+        tokenizer = _StubTokenizer()
+        dataset = CollieDatasetForGeneration(
+            [{"text": "ab", "target": target}], tokenizer=tokenizer
+        )
+        if isinstance(target, str):
+            expected = [tokenizer(target).input_ids]
+        else:
+            expected = [tokenizer(x).input_ids for x in target]
+        sample = dataset[0]
+        assert sample["input_ids"] == [1, 97, 98]
+        assert sample["target"] == expected
+
+    @pytest.mark.parametrize("add_special_tokens", [True, False])
+    @pytest.mark.parametrize("outputs", [["A", "B", "A"], ["是", "否"], []])
+    def test_classification_harness(self, add_special_tokens, outputs):
+        """
+            测试候选项批量分词的结果与逐个分词一致，包括重复和空的候选项列表
+        """
+        tokenizer = _StubTokenizer()
+        dataset = CollieDatasetForClassification(
+            [{"input": "q:", "output": outputs, "target": 0}],
+            tokenizer=tokenizer,
+            add_special_tokens=add_special_tokens,
+        )
+        expected = [
+            _per_segment_labels(tokenizer, "q:", output, add_special_tokens)
+            for output in outputs
+        ]
+        sample = dataset[0]
+        assert list(sample["input_ids"]) == [input_ids for input_ids, _ in expected]
+        assert list(sample["labels"]) == [labels for _, labels in expected]
+        assert list(sample["attention_mask"]) == [
+            [1] * len(input_ids) for input_ids, _ in expected
+        ]
+        assert sample["target"] == 0
+
+    def test_training_empty_output(self):
+        """
+            测试减去 bos 后 target_length 为 0 时不屏蔽任何 token
+        """
+        tokenizer = _StubTokenizer()
+        dataset = CollieDatasetForTraining(
+            [{"input": "ab", "output": ""}], tokenizer=tokenizer
+        )
+        input_ids, labels = _per_segment_labels(tokenizer, "ab", "", True)
+        sample = dataset[0]
+        assert sample["input_ids"] == [1, 97, 98]
+        assert sample["labels"] == labels == [1, 97, 98]
+
+    def test_training_empty_input_ids(self):
+        """
+            测试 input_ids 为空时 labels 仍为空的整数列表
+        """
+        dataset = CollieDatasetForTraining(
+            [{"input": "", "output": ""}],
+            tokenizer=_StubTokenizer(),
+            add_special_tokens=False,
+        )
+        sample = dataset[0]
+        assert sample["input_ids"] == []
+        assert sample["labels"] == []
+        assert sample["attention_mask"] == []
+
+    def test_classification_empty_option(self):
+        """
+            测试候选项为空字符串时不屏蔽任何 token
+        """
+        dataset = CollieDatasetForClassification(
+            [{"input": "q", "output": ["", "a"], "target": 1}],
+            tokenizer=_StubTokenizer(),
+        )
+        sample = dataset[0]
+        assert sample["labels"] == ([1, 113], [-100, -100, 97])